@@ -20,9 +20,12 @@ IO7  ADC5
 GND  GND
 '''
 
+import os
 import sys
 # pip install pyserial
 import serial
+import socket
+import tempfile
 import time
 import argparse
 import pytest
@@ -32,6 +35,32 @@ import contextlib
 logger = logging.getLogger(__name__)
 
 ADC_MAX = 6
+# ADC channel -> GPIO pin, per the table above (ADC4/ADC5 live on IO6/IO7)
+_ADC_TO_GPIO = (0, 1, 2, 3, 6, 7)
+
+_HEXVAL = [-1] * 256
+for _c in b'0123456789abcdefABCDEF':
+    _HEXVAL[_c] = int(chr(_c), 16)
+
+def _parse_hex(line):
+    '''
+    decode a short ASCII hex reply (readall: 1-2 digits) by table
+    lookup, skipping str decode and the int parser
+    '''
+    v = 0
+    for c in line:
+        v = v << 4 | _HEXVAL[c]
+    return v
+
+def _parse_dec(line):
+    '''
+    decode a short ASCII decimal reply (adc read: up to 4 digits)
+    without invoking the full int parser
+    '''
+    v = 0
+    for c in line:
+        v = v * 10 + c - 48
+    return v
 
 class ADC_IN:
 
@@ -45,10 +74,28 @@ class DIGIT_IN:
 
     def __init__(self, gpio):
         self._gpio = gpio
-    
+        self._snapshot = None
+
     def __getitem__(self, channel):
+        if self._snapshot is not None:
+            # same contract as the device read path
+            if not 0 <= channel < 8:
+                raise IndexError(f'gpio channel out of range: {channel}')
+            return self._snapshot >> channel & 1
         return self._gpio._gpio_read(channel)
 
+    @contextlib.contextmanager
+    def snapshot(self):
+        '''
+        read all pins in one round trip and serve __getitem__ from the
+        cached value inside the with block
+        '''
+        self._snapshot = self._gpio.read_port()
+        try:
+            yield self
+        finally:
+            self._snapshot = None
+
 class DIGIT_OUT:
     
     def __init__(self, gpio):
@@ -63,15 +110,56 @@ class DIGIT_OUT:
 class GPIO:
 
     ENTER = '\r'
+    _ENTER = b'\r'
 
-    def __init__(self, port_file):
+    def __init__(self, port_file, timeout=1.0, cache_ttl=0.0):
         logger.debug(f'connecting serial port {port_file} ...')
-        self._serial_port = serial.Serial(port_file, 19200, timeout=0)
+        # the device sends its response back-to-back then idles, so a
+        # 5ms inter-byte gap (10x byte time at 19200 baud) ends each
+        # chunk read promptly; timeout only bounds the wait for the
+        # first byte
+        s = serial.Serial()
+        s.port = port_file
+        s.baudrate = 19200
+        s.timeout = timeout
+        s.write_timeout = 1.0
+        s.inter_byte_timeout = 0.005
+        # configure before open so DTR is never asserted: asserting it
+        # resets some USB CDC boards and costs hundreds of ms
+        s.dtr = False
+        s.rts = False
+        s.open()
+        # drop any stale boot-banner bytes left in the driver buffers
+        s.reset_input_buffer()
+        s.reset_output_buffer()
+        self._serial_port = s
+        self._buf = bytearray()
+        # constant for a connected board, cached on first access
+        self._version = None
+        self._id_cache = None
+        # pre-encoded commands for the hot write/read paths
+        self._set_cmd = [f'gpio set {c}{self.ENTER}'.encode() for c in range(8)]
+        self._clear_cmd = [f'gpio clear {c}{self.ENTER}'.encode() for c in range(8)]
+        self._read_cmd = [f'gpio read {c}'.encode() for c in range(8)]
+        self._adc_cmd = [f'adc read {c}'.encode() for c in range(ADC_MAX)]
         logger.debug(f'serial port {port_file} connected.')
         # when powered on
         # register value is 0
         # iodir is all input (0xff)
-        # yet mask is kept in ROM
+        # yet mask is kept in ROM, so it is unknown until we set it
+        self._mask = None
+        # shadow of the device state so bit queries can skip the port:
+        # output bits are served from _shadow_out, input bits from
+        # _shadow_in while younger than cache_ttl seconds (0 disables)
+        self._iodir = 0xff
+        self._shadow_out = 0
+        self._shadow_in = None
+        self._shadow_in_time = 0.0
+        self._cache_ttl = cache_ttl
+        # inside pipelined() write-only commands do not wait for their
+        # prompts; we count them and absorb the echoes later
+        self._pipelining = False
+        self._pending_prompts = 0
         self._adc_in = ADC_IN(self)
         self._digit_in = DIGIT_IN(self)
         self._digit_out = DIGIT_OUT(self)
@@ -93,41 +181,96 @@ class GPIO:
     def digit_out(self):
         return self._digit_out
 
+    def _readline(self, eol=b'\n'):
+        '''
+        read through eol, buffering the port in 512-byte chunks
+        returns b'' on timeout before eol is seen
+        '''
+        while True:
+            i = self._buf.find(eol)
+            if i >= 0:
+                i += len(eol)
+                line = bytes(self._buf[:i])
+                del self._buf[:i]
+                return line
+            chunk = self._serial_port.read(512)
+            if not chunk:
+                return b''
+            self._buf.extend(chunk)
+
     def _read(self):
-        lines = []
-        line = None
-        # skip empty lines
-        while not line:
-            line = self._serial_port.readline()
-        # read all non-empty lines
-        while line:
-            logger.debug(f'read: {line}')
-            lines.append(line)
-            line = self._serial_port.readline()
-        # lines[-3] is the command itself
-        # lines[-2] is the result, begin with '\r' and end with '\n'
-        # lines[-1] is the prompt
-        assert len(lines) >= 3, lines
-        assert lines[-2].startswith(b'\r'), lines[-2]
-        assert lines[-2].endswith(b'\n'), lines[-2]
-        return lines[-2][1:-1]
+        self._drain_pending()
+        # the prompt '\r>' has no trailing newline, so reading until it
+        # ends the response without waiting out a timeout
+        buf = self._readline(b'\r>')
+        logger.debug(f'read: {buf}')
+        assert buf.endswith(b'\r>'), buf
+        # the result line sits between the last two newlines (echo before
+        # it, prompt after it) and begins with '\r'; slice it out in place
+        # instead of materializing a list of lines
+        j = buf.rfind(b'\n', 0, -2)
+        i = buf.rfind(b'\n', 0, j)
+        assert i >= 0, buf
+        assert buf[i + 1:i + 2] == b'\r', buf
+        return buf[i + 2:j]
 
     def _consume(self):
-        lines = []
-        line = None
-        while not line:
-            line = self._serial_port.readline()
-        while line:
-            logger.debug(f'read: {line}')
-            lines.append(line)
-            line = self._serial_port.readline()
-        # lines[-2] is the command itself
-        # lines[-1] is the prompt '\r>'
-        assert len(lines) >= 2, lines
+        if self._pipelining:
+            self._pending_prompts += 1
+            return
+        self._consume_one()
+
+    def _consume_one(self):
+        buf = self._readline(b'\r>')
+        logger.debug(f'read: {buf}')
+        # the command echo followed by the prompt '\r>'
+        assert buf.endswith(b'\r>'), buf
+
+    def _drain_pending(self):
+        while self._pending_prompts:
+            self._pending_prompts -= 1
+            self._consume_one()
+
+    @contextlib.contextmanager
+    def pipelined(self):
+        '''
+        queue write-only commands back-to-back without waiting for each
+        prompt; the echoes are absorbed on exit (or before the next read)
+        '''
+        self._pipelining = True
+        try:
+            yield self
+        finally:
+            self._pipelining = False
+            self._drain_pending()
+
+    def _batch(self, cmds):
+        '''
+        write several independent commands back-to-back, then collect
+        their responses in order; submission overlaps with the device's
+        echo processing instead of paying one round trip each
+        '''
+        self._drain_pending()
+        payload = b''.join(c + self._ENTER for c in cmds)
+        logger.debug(f'write: {payload}')
+        self._serial_port.write(payload)
+        return [self._read() for _ in cmds]
 
     def _write(self, s):
         logger.debug(f'write: {s}')
-        self._serial_port.write(f'{s}{self.ENTER}'.encode())
+        # commands are ASCII; pre-encoded callers skip the codec entirely
+        if isinstance(s, str):
+            s = s.encode('ascii')
+        self._serial_port.write(s + self._ENTER)
+
+    def read_port(self):
+        '''
+        read all GPIO pins in a single round trip
+        '''
+        self._write('gpio readall')
+        self._shadow_in = _parse_hex(self._read())
+        self._shadow_in_time = time.monotonic()
+        return self._shadow_in
 
     @property
     def value(self):
@@ -135,8 +278,7 @@ class GPIO:
         read the status of all GPIO pins
         if a pin is adc reading, the value in correspoding bit is always 0 until the iodir is changed to output
         '''
-        self._write('gpio readall')
-        return int(self._read(), 16)
+        return self.read_port()
     
     @value.setter
     def value(self, v):
@@ -146,48 +288,99 @@ class GPIO:
         v &= 255
         self._write(f'gpio writeall {v:02x}')
         self._consume()
+        if self._mask is not None:
+            self._shadow_out = self._shadow_out & ~self._mask | v & self._mask
+        else:
+            self._shadow_out = v
 
     @property
     def version(self):
-        self._write('ver')
-        line = self._read()
-        return line.decode()
+        if self._version is None:
+            self._write('ver')
+            self._version = self._read().decode()
+        return self._version
 
     def _gpio_read(self, channel):
-        self._write(f'gpio read {channel}')
+        # a negative channel would silently alias another pin through the
+        # command table, so reject it before touching the port
+        if not 0 <= channel < 8:
+            raise IndexError(f'gpio channel out of range: {channel}')
+        self._write(self._read_cmd[channel])
         line = self._read()
-        return int(line)
+        # read turns the pin into input mode
+        self._iodir |= 1 << channel
+        # the reply is a single '0' or '1'
+        return 1 if line == b'1' else 0
 
     def _gpio_write(self, channel, b):
-        cmd = ['clear', 'set'][bool(b)]
-        self._write(f'gpio {cmd} {channel}')
+        if not 0 <= channel < 8:
+            raise IndexError(f'gpio channel out of range: {channel}')
+        cmd = self._set_cmd[channel] if b & 1 else self._clear_cmd[channel]
+        logger.debug(f'write: {cmd}')
+        self._serial_port.write(cmd)
         self._consume()
+        # set/clear turns the pin into output mode
+        self._iodir &= ~(1 << channel)
+        if b & 1:
+            self._shadow_out |= 1 << channel
+        else:
+            self._shadow_out &= ~(1 << channel)
 
     def _adc_read(self, channel):
-        self._write(f'adc read {channel}')
+        if not 0 <= channel < ADC_MAX:
+            raise IndexError(f'adc channel out of range: {channel}')
+        self._write(self._adc_cmd[channel])
         line = self._read()
-        return int(line)
+        # the pin that went into input mode is the mapped GPIO, not the
+        # ADC channel number
+        self._iodir |= 1 << _ADC_TO_GPIO[channel]
+        return _parse_dec(line)
 
     @property
     def id(self, value=0):
-        self._write('id get')
-        return self._read().decode()
+        if self._id_cache is None:
+            self._write('id get')
+            self._id_cache = self._read().decode()
+        return self._id_cache
 
     @id.setter
     def id(self, value=0):
-        if type(value) == int: value = f'{value:08}'
+        if isinstance(value, int): value = f'{value:08}'
         value = str(value)[:8]
         self._write(f'id set {value:>8}')
         self._consume()
+        self._id_cache = f'{value:>8}'
 
     def __getitem__(self, channel):
-        if type(channel) == int and channel in range(8):
+        if isinstance(channel, int) and 0 <= channel < 8:
+            if not self._iodir >> channel & 1:
+                # output pin: the last written bit is authoritative
+                return self._shadow_out >> channel & 1
+            if self._shadow_in is not None and \
+                    time.monotonic() - self._shadow_in_time < self._cache_ttl:
+                return self._shadow_in >> channel & 1
             return self.value >> channel & 1
 
     def __setitem__(self, channel, bit):
-        if type(channel) == int and channel in range(8):
+        if isinstance(channel, int) and 0 <= channel < 8:
             self._gpio_write(channel, bit & 1)
 
+    def write_pins(self, updates):
+        '''
+        set several output pins in one writeall transaction
+        updates maps channel -> bit
+        '''
+        mask = 0
+        value = 0
+        for channel, bit in updates.items():
+            mask |= 1 << channel
+            value |= (bit & 1) << channel
+        previous = self._mask
+        self.set_mask(mask)
+        self.value = value
+        # mask persists in ROM; fall back to all-enabled if never set
+        self.set_mask(previous if previous is not None else 0xff)
+
     def set_mask(self, value):
         '''
         affect writeall/iodir
@@ -196,6 +389,7 @@ class GPIO:
         '''
         self._write(f'gpio iomask {value:02x}')
         self._consume()
+        self._mask = value
 
     def set_iodir(self, value):
         '''
@@ -204,20 +398,35 @@ class GPIO:
         '''
         self._write(f'gpio iodir {value:02x}')
         self._consume()
+        if self._mask is not None:
+            self._iodir = value & self._mask | self._iodir & ~self._mask
+        else:
+            self._iodir = value
         
     def __repr__(self):
-        return f'<gpio version: {self.version}; id: {self.id}; bits: {self.value:08b}>'
+        if self._version is None or self._id_cache is None:
+            # one pipelined transaction instead of three round trips
+            ver, ident, bits = self._batch([b'ver', b'id get', b'gpio readall'])
+            self._version = ver.decode()
+            self._id_cache = ident.decode()
+            value = _parse_hex(bits)
+            self._shadow_in = value
+            self._shadow_in_time = time.monotonic()
+        else:
+            value = self.value
+        return f'<gpio version: {self.version}; id: {self.id}; bits: {value:08b}>'
 
 @contextlib.contextmanager
-def open(port_file):
+def connect(port_file):
+    g = GPIO(port_file)
     try:
-        g = GPIO(port_file)
         yield g
-    except:
-        pass
     finally:
         g.close()
 
+# deprecated alias; shadows the builtin open
+open = connect
+
 # ===========================================================================
 # cmd interface
 # ===========================================================================
@@ -225,26 +434,105 @@ def open(port_file):
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('port', help='COMx for windows, /dev/ttyUSBx for linux, /dev/tty.usbmodemxxx for mac')
-    parser.add_argument('mode', choices=['adc', 'digit'])
-    parser.add_argument('channel', type=int)
+    parser.add_argument('mode', nargs='?', choices=['adc', 'digit'])
+    parser.add_argument('channel', nargs='?', type=int)
     parser.add_argument('-v', '--value', type=int, default=None)
-    return parser.parse_args()
+    parser.add_argument('-d', '--daemon', action='store_true',
+                        help='keep the port open and serve repeated CLI calls over a local socket')
+    args = parser.parse_args()
+    if not args.daemon and (args.mode is None or args.channel is None):
+        parser.error('mode and channel are required unless --daemon')
+    return args
+
+def _socket_path(port):
+    name = os.path.basename(port)
+    return os.path.join(tempfile.gettempdir(), f'numato-gpio-{name}.sock')
+
+def _execute(g, mode, channel, value):
+    if mode == 'adc':
+        l = g.adc_in
+    if mode == 'digit':
+        l = g.digit_out if value else g.digit_in
+    if value:
+        l[channel] = value
+        return None
+    return l[channel]
+
+def serve(port):
+    '''
+    open the GPIO once and answer CLI requests over a unix socket
+    one line each way: 'MODE CHANNEL [VALUE]' -> result (or 'ok')
+    '''
+    path = _socket_path(port)
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    with connect(port) as g, socket.socket(socket.AF_UNIX) as server:
+        server.bind(path)
+        server.listen()
+        logger.info(f'serving {port} on {path}')
+        try:
+            while True:
+                conn, _ = server.accept()
+                with conn:
+                    # a misbehaving client must not wedge or kill the
+                    # daemon: bound its I/O and absorb socket errors
+                    conn.settimeout(5.0)
+                    try:
+                        words = conn.makefile().readline().split()
+                        try:
+                            mode = words[0]
+                            channel = int(words[1])
+                            value = int(words[2]) if len(words) > 2 else None
+                            result = _execute(g, mode, channel, value)
+                            reply = 'ok' if result is None else str(result)
+                        except Exception as e:
+                            logger.warning(f'bad request {words}: {e}')
+                            reply = 'error'
+                        conn.sendall(f'{reply}\n'.encode())
+                    except OSError as e:
+                        logger.warning(f'client connection failed: {e}')
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+def request_daemon(port, mode, channel, value):
+    '''
+    forward one command to a running daemon
+    returns the reply line, or None if no daemon is reachable
+    '''
+    try:
+        with socket.socket(socket.AF_UNIX) as s:
+            s.connect(_socket_path(port))
+            line = f'{mode} {channel}' if value is None else f'{mode} {channel} {value}'
+            s.sendall(f'{line}\n'.encode())
+            return s.makefile().readline().strip()
+    except (AttributeError, OSError):
+        return None
 
 def main(port, mode, channel, value):
-    with open(port) as g:
-        if mode == 'adc':
-            l = g.adc_in
-        if mode == 'digit':
-            l = g.digit_out if value else g.digit_in
-        if value:
-            l[channel] = value
-        else:
-            print(l[channel])
+    # prefer a running daemon: one socket round trip instead of a full
+    # serial open + command + close
+    reply = request_daemon(port, mode, channel, value)
+    if reply is not None:
+        if reply == 'error':
+            # fail like the direct path would instead of masking it
+            print(f'daemon rejected: {mode} {channel}', file=sys.stderr)
+            sys.exit(1)
+        if not value:
+            print(reply)
+        return
+    with connect(port) as g:
+        result = _execute(g, mode, channel, value)
+        if result is not None:
+            print(result)
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.WARN, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
     args = parse_args()
-    main(args.port, args.mode, args.channel, args.value)
+    if args.daemon:
+        serve(args.port)
+    else:
+        main(args.port, args.mode, args.channel, args.value)
 
 
 # digit output has low-impedance, use 1K resisitor on the Pin to device to drive.